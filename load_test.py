@@ -0,0 +1,102 @@
+"""Load test for server.py.
+
+Opens an increasing number of concurrent AI-vs-AI sessions, plays each one
+move by move and reports moves per second and move latency percentiles for
+every session count. With --local the server runs inside this process, so no
+separate server is needed.
+
+Usage:
+    python load_test.py --local --sessions 1,2,4,8,16 --move-time 0.05
+    python load_test.py --port 8765 --sessions 4,16
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from typing import List, Tuple
+
+from server import DEFAULT_HOST, DEFAULT_PORT, GameServer
+
+
+async def send(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: dict) -> dict:
+    writer.write(json.dumps(request).encode() + b'\n')
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    if not response.get('ok'):
+        raise RuntimeError(response.get('error', 'request failed'))
+    return response
+
+
+async def play_session(host: str, port: int, move_time: float, max_plies: int,
+                       latencies: List[float]) -> int:
+    """Play one AI-vs-AI game, recording the latency of every move"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        state = await send(reader, writer, {'cmd': 'new', 'mode': 'ai_vs_ai', 'move_time': move_time})
+        session_id = state['session']
+        moves = 0
+        while state['status'] == 'ongoing' and moves < max_plies:
+            start = time.perf_counter()
+            state = await send(reader, writer, {'cmd': 'ai_move', 'session': session_id})
+            latencies.append(time.perf_counter() - start)
+            moves += 1
+        await send(reader, writer, {'cmd': 'close', 'session': session_id})
+        return moves
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run_round(host: str, port: int, sessions: int, move_time: float,
+                    max_plies: int) -> Tuple[int, float, List[float]]:
+    latencies = []
+    start = time.perf_counter()
+    moves = await asyncio.gather(*(play_session(host, port, move_time, max_plies, latencies)
+                                   for _ in range(sessions)))
+    return sum(moves), time.perf_counter() - start, latencies
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run(args):
+    server = None
+    host, port = args.host, args.port
+    if args.local:
+        server = GameServer(args.workers)
+        await server.start(host, 0)
+        port = server.port
+        print(f"Started local server on {host}:{port} with {args.workers} search workers")
+    try:
+        print(f"{'sessions':>8} {'moves':>7} {'moves/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        for sessions in args.sessions:
+            moves, elapsed, latencies = await run_round(host, port, sessions, args.move_time, args.max_plies)
+            print(f"{sessions:>8} {moves:>7} {moves / elapsed:>9.1f} "
+                  f"{percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f}")
+    finally:
+        if server:
+            await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure server throughput and move latency')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--local', action='store_true', help='run the server inside this process')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='search workers of the local server')
+    parser.add_argument('--sessions', type=lambda value: [int(n) for n in value.split(',')],
+                        default=[1, 2, 4, 8, 16], help='comma separated session counts')
+    parser.add_argument('--move-time', type=float, default=0.05, help='seconds per AI move')
+    parser.add_argument('--max-plies', type=int, default=40, help='moves played per game')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
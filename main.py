@@ -5,6 +5,9 @@ import math
 import pygame_menu
 import random
 import os
+import json
+import threading
+import time
 
 # Initialize Pygame
 pygame.init()
@@ -49,8 +52,148 @@ MESSAGES = {
     'turn': "{}'s turn",
     'check': '{} is in check!',
     'checkmate': 'Checkmate! {} wins!',
+    'stalemate': 'Stalemate! Draw.',
+    'draw': 'Draw by {}.',
+    'promotion': 'Promote to: Q, R, B or N',
 }
 
+# Integer codes used by the engine; the names are only needed by the UI
+COLOR_WHITE, COLOR_BLACK = 0, 1
+EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(7)
+COLOR_NAMES = ('white', 'black')
+PIECE_NAMES = (None, 'pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+COLOR_CODES = {name: code for code, name in enumerate(COLOR_NAMES)}
+PIECE_CODES = {name: code for code, name in enumerate(PIECE_NAMES) if name}
+
+# Moves are packed into 16 bits: destination square (bits 0-5), start square
+# (bits 6-11), promotion piece minus KNIGHT (bits 12-13) and a flag (bits 14-15)
+MOVE_NORMAL = 0
+MOVE_PROMOTION = 1 << 14
+MOVE_EN_PASSANT = 2 << 14
+MOVE_CASTLING = 3 << 14
+MOVE_FLAG_MASK = 3 << 14
+
+def encode_move(start: Tuple[int, int], end: Tuple[int, int], flag: int = MOVE_NORMAL, promotion: int = KNIGHT) -> int:
+    return (flag | (promotion - KNIGHT) << 12
+            | (start[0] * BOARD_SIZE + start[1]) << 6 | end[0] * BOARD_SIZE + end[1])
+
+def decode_move(move: int) -> Tuple[Tuple[int, int], Tuple[int, int], Optional[str]]:
+    """Unpack a move into (start, end, promotion piece name) for the UI"""
+    start = divmod((move >> 6) & 63, BOARD_SIZE)
+    end = divmod(move & 63, BOARD_SIZE)
+    promotion = None
+    if move & MOVE_FLAG_MASK == MOVE_PROMOTION:
+        promotion = PIECE_NAMES[((move >> 12) & 3) + KNIGHT]
+    return start, end, promotion
+
+# Move geometry
+ROOK_DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+KNIGHT_OFFSETS = [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)]
+KING_OFFSETS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+PROMOTION_TYPES = (QUEEN, ROOK, BISHOP, KNIGHT)
+PROMOTION_KEYS = {
+    pygame.K_q: 'queen',
+    pygame.K_r: 'rook',
+    pygame.K_b: 'bishop',
+    pygame.K_n: 'knight'
+}
+FEN_PIECES = {
+    'p': PAWN, 'n': KNIGHT, 'b': BISHOP,
+    'r': ROOK, 'q': QUEEN, 'k': KING
+}
+FEN_CHARS = {code: char for char, code in FEN_PIECES.items()}
+
+# Zobrist keys for position hashing (repetition detection), indexed [color][piece][square]
+_zobrist_random = random.Random(20240601)
+ZOBRIST_PIECES = [
+    [[_zobrist_random.getrandbits(64) for _ in range(BOARD_SIZE * BOARD_SIZE)] for _ in PIECE_NAMES]
+    for _ in COLOR_NAMES
+]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(4)]
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(BOARD_SIZE)]
+
+# Search settings
+AI_THINK_TIME = 1.0  # seconds per move
+AI_MAX_DEPTH = 6
+MATE_SCORE = 100000
+MATE_THRESHOLD = MATE_SCORE - 1000  # scores beyond this are mates
+TT_MAX_ENTRIES = 1000000
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+
+# Evaluation parameters (can be tuned offline with tuner.py)
+EVAL_PARAMS_PATH = 'eval_params.json'
+DEFAULT_EVAL_PARAMS = {
+    'piece_values': {
+        'pawn': 1,
+        'knight': 3,
+        'bishop': 3,
+        'rook': 5,
+        'queen': 9,
+        'king': 100
+    },
+    'capture_weight': 10,
+    'center_bonus': 2,
+    'development_bonus': 1,
+    'repeat_move_penalty': 1,
+}
+
+def load_eval_params(path: str = EVAL_PARAMS_PATH) -> dict:
+    """Load evaluation parameters from a JSON file, falling back to the defaults"""
+    params = dict(DEFAULT_EVAL_PARAMS)
+    params['piece_values'] = dict(DEFAULT_EVAL_PARAMS['piece_values'])
+    try:
+        with open(path, encoding='utf-8') as f:
+            loaded = json.load(f)
+    except FileNotFoundError:
+        return params
+    except (OSError, ValueError) as e:
+        print(f"Error loading evaluation parameters: {e}")
+        return params
+    params['piece_values'].update(loaded.get('piece_values', {}))
+    for key in ('capture_weight', 'center_bonus', 'development_bonus', 'repeat_move_penalty'):
+        if key in loaded:
+            params[key] = loaded[key]
+    return params
+
+# Evaluation features (white minus black), shared by ChessAI and tuner.py
+EVAL_FEATURES = ['pawn', 'knight', 'bishop', 'rook', 'queen', 'center', 'development']
+FEATURE_CENTER = EVAL_FEATURES.index('center')
+FEATURE_DEVELOPMENT = EVAL_FEATURES.index('development')
+CENTER_SQUARES = {(3, 3), (3, 4), (4, 3), (4, 4)}
+# Starting squares of the minor pieces, a minor piece elsewhere counts as developed
+MINOR_HOME_SQUARES = {
+    (COLOR_WHITE, KNIGHT): {(7, 1), (7, 6)},
+    (COLOR_WHITE, BISHOP): {(7, 2), (7, 5)},
+    (COLOR_BLACK, KNIGHT): {(0, 1), (0, 6)},
+    (COLOR_BLACK, BISHOP): {(0, 2), (0, 5)},
+}
+
+def position_features(pieces) -> List[int]:
+    """Feature vector of (color, piece type, row, col) codes; the king is never counted"""
+    features = [0] * len(EVAL_FEATURES)
+    for color, piece_type, row, col in pieces:
+        if piece_type == KING:
+            continue
+        sign = 1 if color == COLOR_WHITE else -1
+        features[piece_type - PAWN] += sign
+        if (row, col) in CENTER_SQUARES:
+            features[FEATURE_CENTER] += sign
+        home = MINOR_HOME_SQUARES.get((color, piece_type))
+        if home is not None and (row, col) not in home:
+            features[FEATURE_DEVELOPMENT] += sign
+    return features
+
+def params_to_weights(params: dict) -> List[float]:
+    """Weights matching EVAL_FEATURES"""
+    capture_weight = params['capture_weight']
+    weights = [params['piece_values'][name] * capture_weight for name in EVAL_FEATURES[:FEATURE_CENTER]]
+    weights.append(params['center_bonus'])
+    weights.append(params['development_bonus'])
+    return weights
+
 # Загрузка изображений
 PIECES_IMAGES = {}
 BOARD_IMAGE = None
@@ -70,17 +213,24 @@ def load_images():
             img = pygame.transform.scale(img, (piece_width, piece_height))
             PIECES_IMAGES[f'{color}_{piece}'] = img
 
-# Initialize the screen
-screen = pygame.display.set_mode((WINDOW_SIZE, TOTAL_HEIGHT))
-pygame.display.set_caption('Chess')
-
 class Piece:
-    def __init__(self, color: str, piece_type: str, position: Tuple[int, int]):
-        self.color = color
-        self.piece_type = piece_type
+    __slots__ = ('color_id', 'type_id', 'position', 'has_moved')
+
+    def __init__(self, color, piece_type, position: Tuple[int, int]):
+        # Accept either names (UI) or integer codes (engine)
+        self.color_id = COLOR_CODES[color] if isinstance(color, str) else color
+        self.type_id = PIECE_CODES[piece_type] if isinstance(piece_type, str) else piece_type
         self.position = position
         self.has_moved = False
 
+    @property
+    def color(self) -> str:
+        return COLOR_NAMES[self.color_id]
+
+    @property
+    def piece_type(self) -> str:
+        return PIECE_NAMES[self.type_id]
+
     def draw(self, surface: pygame.Surface, is_flipped: bool = False):
         piece_key = f'{self.color}_{self.piece_type}'
         if piece_key in PIECES_IMAGES:
@@ -103,13 +253,18 @@ class ChessBoard:
         self.board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
         self.selected_piece = None
         self.valid_moves = []
-        self.current_turn = 'white'
+        self.turn = COLOR_WHITE
         self.initialize_board()
-        self.white_king_pos = (7, 4)
-        self.black_king_pos = (0, 4)
+        self.king_positions = [(7, 4), (0, 4)]
         self.is_check = False
         self.is_checkmate = False
+        self.is_stalemate = False
+        self.draw_reason = None
         self.game_over = False
+        self.en_passant_target = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.reset_history()
         self.ai_move_from = None
         self.ai_move_to = None
         self.ai_move_display_time = 0
@@ -125,14 +280,14 @@ class ChessBoard:
     def initialize_board(self):
         # Initialize pawns
         for col in range(BOARD_SIZE):
-            self.board[1][col] = Piece('black', 'pawn', (1, col))
-            self.board[6][col] = Piece('white', 'pawn', (6, col))
+            self.board[1][col] = Piece(COLOR_BLACK, PAWN, (1, col))
+            self.board[6][col] = Piece(COLOR_WHITE, PAWN, (6, col))
 
         # Initialize other pieces
-        piece_order = ['rook', 'knight', 'bishop', 'queen', 'king', 'bishop', 'knight', 'rook']
+        piece_order = [ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK]
         for col in range(BOARD_SIZE):
-            self.board[0][col] = Piece('black', piece_order[col], (0, col))
-            self.board[7][col] = Piece('white', piece_order[col], (7, col))
+            self.board[0][col] = Piece(COLOR_BLACK, piece_order[col], (0, col))
+            self.board[7][col] = Piece(COLOR_WHITE, piece_order[col], (7, col))
 
     def start_animation(self, piece, start, end, callback=None):
         self.animating = True
@@ -224,14 +379,25 @@ class ChessBoard:
             self.ai_move_from = None
             self.ai_move_to = None
         if self.is_check:
-            king_pos = self.white_king_pos if self.current_turn == 'white' else self.black_king_pos
-            k_row, k_col = king_pos
+            k_row, k_col = self.king_positions[self.turn]
             if is_flipped:
                 k_row, k_col = 7 - k_row, 7 - k_col
             s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
             pygame.draw.rect(s, RED_HIGHLIGHT, s.get_rect())
             surface.blit(s, (k_col * SQUARE_SIZE, k_row * SQUARE_SIZE))
 
+    @property
+    def current_turn(self) -> str:
+        return COLOR_NAMES[self.turn]
+
+    @property
+    def white_king_pos(self) -> Tuple[int, int]:
+        return self.king_positions[COLOR_WHITE]
+
+    @property
+    def black_king_pos(self) -> Tuple[int, int]:
+        return self.king_positions[COLOR_BLACK]
+
     def get_piece_at(self, pos: Tuple[int, int]) -> Optional[Piece]:
         row, col = pos
         if 0 <= row < BOARD_SIZE and 0 <= col < BOARD_SIZE:
@@ -245,93 +411,74 @@ class ChessBoard:
     def get_all_valid_moves(self, piece: Piece, check_for_check: bool = True) -> List[Tuple[int, int]]:
         valid_moves = []
         row, col = piece.position
+        color = piece.color_id
+        piece_type = piece.type_id
+        board = self.board
 
-        def add_move(new_row: int, new_col: int, continuous: bool = False) -> bool:
-            if not self.is_valid_position((new_row, new_col)):
-                return False
-            
-            target_piece = self.board[new_row][new_col]
-            if target_piece is None:
-                valid_moves.append((new_row, new_col))
-                return True
-            elif target_piece.color != piece.color:
-                valid_moves.append((new_row, new_col))
-                return False
-            return False
+        def add_slides(directions):
+            for drow, dcol in directions:
+                current_row = row + drow
+                current_col = col + dcol
+                while 0 <= current_row < BOARD_SIZE and 0 <= current_col < BOARD_SIZE:
+                    target_piece = board[current_row][current_col]
+                    if target_piece is None:
+                        valid_moves.append((current_row, current_col))
+                    else:
+                        if target_piece.color_id != color:
+                            valid_moves.append((current_row, current_col))
+                        break
+                    current_row += drow
+                    current_col += dcol
 
-        if piece.piece_type == 'pawn':
-            direction = 1 if piece.color == 'black' else -1
+        def add_steps(offsets):
+            for drow, dcol in offsets:
+                new_row, new_col = row + drow, col + dcol
+                if 0 <= new_row < BOARD_SIZE and 0 <= new_col < BOARD_SIZE:
+                    target = board[new_row][new_col]
+                    if target is None or target.color_id != color:
+                        valid_moves.append((new_row, new_col))
+
+        if piece_type == PAWN:
+            direction = 1 if color == COLOR_BLACK else -1
+            start_row = 1 if color == COLOR_BLACK else 6
             
             # Move forward
-            if self.is_valid_position((row + direction, col)) and not self.board[row + direction][col]:
+            if 0 <= row + direction < BOARD_SIZE and not board[row + direction][col]:
                 valid_moves.append((row + direction, col))
                 # Initial two-square move
-                if not piece.has_moved and not self.board[row + 2*direction][col]:
+                if row == start_row and not board[row + 2*direction][col]:
                     valid_moves.append((row + 2*direction, col))
             
-            # Capture diagonally
-            for dcol in [-1, 1]:
-                new_col = col + dcol
-                new_row = row + direction
-                if self.is_valid_position((new_row, new_col)):
-                    target = self.board[new_row][new_col]
-                    if target and target.color != piece.color:
-                        valid_moves.append((new_row, new_col))
+            # Capture diagonally (including en passant)
+            new_row = row + direction
+            if 0 <= new_row < BOARD_SIZE:
+                for new_col in (col - 1, col + 1):
+                    if 0 <= new_col < BOARD_SIZE:
+                        target = board[new_row][new_col]
+                        if target is not None:
+                            if target.color_id != color:
+                                valid_moves.append((new_row, new_col))
+                        elif self.en_passant_target == (new_row, new_col):
+                            valid_moves.append((new_row, new_col))
 
-        elif piece.piece_type == 'rook':
-            for direction in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                current_row = row + direction[0]
-                current_col = col + direction[1]
-                while self.is_valid_position((current_row, current_col)):
-                    if not add_move(current_row, current_col, True):
-                        break
-                    current_row += direction[0]
-                    current_col += direction[1]
-
-        elif piece.piece_type == 'knight':
-            moves = [
-                (row + 2, col + 1), (row + 2, col - 1),
-                (row - 2, col + 1), (row - 2, col - 1),
-                (row + 1, col + 2), (row + 1, col - 2),
-                (row - 1, col + 2), (row - 1, col - 2)
-            ]
-            for move in moves:
-                if self.is_valid_position(move):
-                    target = self.board[move[0]][move[1]]
-                    if not target or target.color != piece.color:
-                        valid_moves.append(move)
-
-        elif piece.piece_type == 'bishop':
-            for direction in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
-                current_row = row + direction[0]
-                current_col = col + direction[1]
-                while self.is_valid_position((current_row, current_col)):
-                    if not add_move(current_row, current_col, True):
-                        break
-                    current_row += direction[0]
-                    current_col += direction[1]
+        elif piece_type == ROOK:
+            add_slides(ROOK_DIRECTIONS)
+
+        elif piece_type == KNIGHT:
+            add_steps(KNIGHT_OFFSETS)
 
-        elif piece.piece_type == 'queen':
+        elif piece_type == BISHOP:
+            add_slides(BISHOP_DIRECTIONS)
+
+        elif piece_type == QUEEN:
             # Combine rook and bishop moves
-            for direction in [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]:
-                current_row = row + direction[0]
-                current_col = col + direction[1]
-                while self.is_valid_position((current_row, current_col)):
-                    if not add_move(current_row, current_col, True):
-                        break
-                    current_row += direction[0]
-                    current_col += direction[1]
-
-        elif piece.piece_type == 'king':
-            for drow in [-1, 0, 1]:
-                for dcol in [-1, 0, 1]:
-                    if drow == 0 and dcol == 0:
-                        continue
-                    new_row, new_col = row + drow, col + dcol
-                    if self.is_valid_position((new_row, new_col)):
-                        target = self.board[new_row][new_col]
-                        if not target or target.color != piece.color:
-                            valid_moves.append((new_row, new_col))
+            add_slides(KING_OFFSETS)
+
+        elif piece_type == KING:
+            add_steps(KING_OFFSETS)
+            # Castling can never capture, so it is skipped when only attacks are needed
+            if check_for_check:
+                valid_moves.extend(self.get_castling_moves(piece))
 
         # Filter moves that would put or leave the king in check
         if check_for_check:
@@ -339,106 +486,515 @@ class ChessBoard:
 
         return valid_moves
 
+    def get_castling_moves(self, king: Piece) -> List[Tuple[int, int]]:
+        """King destinations for castling; the landing square is checked by the usual filter"""
+        row, col = king.position
+        color = king.color_id
+        home_row = 7 if color == COLOR_WHITE else 0
+        if king.has_moved or (row, col) != (home_row, 4):
+            return []
+        if self.is_position_under_attack((row, col), color):
+            return []
+        moves = []
+        for rook_col, step in ((7, 1), (0, -1)):
+            rook = self.board[row][rook_col]
+            if not rook or rook.type_id != ROOK or rook.color_id != color or rook.has_moved:
+                continue
+            between = range(min(col, rook_col) + 1, max(col, rook_col))
+            if any(self.board[row][c] for c in between):
+                continue
+            if self.is_position_under_attack((row, col + step), color):
+                continue
+            moves.append((row, col + 2 * step))
+        return moves
+
     def would_be_in_check(self, piece: Piece, move: Tuple[int, int]) -> bool:
         # Make a temporary move
+        board = self.board
+        color = piece.color_id
         original_pos = piece.position
-        captured_piece = self.board[move[0]][move[1]]
-        self.board[move[0]][move[1]] = piece
-        self.board[original_pos[0]][original_pos[1]] = None
+        captured_piece = board[move[0]][move[1]]
+        # En passant removes a pawn that is not on the destination square
+        en_passant_pos = None
+        if piece.type_id == PAWN and captured_piece is None and move[1] != original_pos[1]:
+            en_passant_pos = (original_pos[0], move[1])
+            en_passant_piece = board[en_passant_pos[0]][en_passant_pos[1]]
+            board[en_passant_pos[0]][en_passant_pos[1]] = None
+        board[move[0]][move[1]] = piece
+        board[original_pos[0]][original_pos[1]] = None
         piece.position = move
 
-        # Update king position if moving king
-        if piece.piece_type == 'king':
-            if piece.color == 'white':
-                self.white_king_pos = move
-            else:
-                self.black_king_pos = move
-
-        # Check if the king is in check
-        king_pos = self.white_king_pos if piece.color == 'white' else self.black_king_pos
-        in_check = self.is_position_under_attack(king_pos, piece.color)
+        # Check if the king is in check (the moving piece may be the king itself)
+        king_pos = move if piece.type_id == KING else self.king_positions[color]
+        in_check = self.is_position_under_attack(king_pos, color)
 
         # Undo the move
-        self.board[original_pos[0]][original_pos[1]] = piece
-        self.board[move[0]][move[1]] = captured_piece
+        board[original_pos[0]][original_pos[1]] = piece
+        board[move[0]][move[1]] = captured_piece
+        if en_passant_pos:
+            board[en_passant_pos[0]][en_passant_pos[1]] = en_passant_piece
         piece.position = original_pos
 
-        # Restore king position if we moved it
-        if piece.piece_type == 'king':
-            if piece.color == 'white':
-                self.white_king_pos = original_pos
-            else:
-                self.black_king_pos = original_pos
-
         return in_check
 
-    def is_position_under_attack(self, pos: Tuple[int, int], friendly_color: str) -> bool:
+    def is_position_under_attack(self, pos: Tuple[int, int], friendly_color: int, board=None) -> bool:
+        # Look outwards from the square instead of generating every enemy move
+        row, col = pos
+        board = self.board if board is None else board
+
+        # Enemy pawns attack diagonally towards the friendly side
+        pawn_row = row - 1 if friendly_color == COLOR_WHITE else row + 1
+        if 0 <= pawn_row < BOARD_SIZE:
+            for pawn_col in (col - 1, col + 1):
+                if 0 <= pawn_col < BOARD_SIZE:
+                    piece = board[pawn_row][pawn_col]
+                    if piece and piece.color_id != friendly_color and piece.type_id == PAWN:
+                        return True
+
+        for offsets, attacker in ((KNIGHT_OFFSETS, KNIGHT), (KING_OFFSETS, KING)):
+            for drow, dcol in offsets:
+                r, c = row + drow, col + dcol
+                if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+                    piece = board[r][c]
+                    if piece and piece.color_id != friendly_color and piece.type_id == attacker:
+                        return True
+
+        for directions, slider in ((ROOK_DIRECTIONS, ROOK), (BISHOP_DIRECTIONS, BISHOP)):
+            for drow, dcol in directions:
+                r, c = row + drow, col + dcol
+                while 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE:
+                    piece = board[r][c]
+                    if piece:
+                        if piece.color_id != friendly_color and (piece.type_id == slider or piece.type_id == QUEEN):
+                            return True
+                        break
+                    r += drow
+                    c += dcol
+        return False
+
+    def has_legal_moves(self, color: Optional[int] = None) -> bool:
+        color = self.turn if color is None else color
         for row in range(BOARD_SIZE):
             for col in range(BOARD_SIZE):
                 piece = self.board[row][col]
-                if piece and piece.color != friendly_color:
-                    # Get valid moves without checking for check (to avoid infinite recursion)
-                    moves = self.get_all_valid_moves(piece, check_for_check=False)
-                    if pos in moves:
-                        return True
+                if piece and piece.color_id == color and self.get_all_valid_moves(piece):
+                    return True
         return False
 
-    def is_in_checkmate(self) -> bool:
-        # Get all pieces of the current player
+    def is_promotion_move(self, piece: Piece, end_row: int) -> bool:
+        return piece.type_id == PAWN and end_row == (0 if piece.color_id == COLOR_WHITE else 7)
+
+    def castling_rights(self) -> Tuple[bool, bool, bool, bool]:
+        """White kingside, white queenside, black kingside, black queenside"""
+        rights = []
+        for color, row in ((COLOR_WHITE, 7), (COLOR_BLACK, 0)):
+            king = self.board[row][4]
+            king_ok = king and king.type_id == KING and king.color_id == color and not king.has_moved
+            for rook_col in (7, 0):
+                rook = self.board[row][rook_col]
+                rights.append(bool(king_ok and rook and rook.type_id == ROOK
+                                   and rook.color_id == color and not rook.has_moved))
+        return tuple(rights)
+
+    def _hash_extras(self) -> int:
+        # Castling rights and a capturable en passant square are part of the position
+        key = 0
+        for index, right in enumerate(self.castling_rights()):
+            if right:
+                key ^= ZOBRIST_CASTLING[index]
+        if self.en_passant_target:
+            ep_row, ep_col = self.en_passant_target
+            pawn_row = ep_row + 1 if self.turn == COLOR_WHITE else ep_row - 1
+            for pawn_col in (ep_col - 1, ep_col + 1):
+                if 0 <= pawn_col < BOARD_SIZE:
+                    pawn = self.board[pawn_row][pawn_col]
+                    if pawn and pawn.type_id == PAWN and pawn.color_id == self.turn:
+                        key ^= ZOBRIST_EN_PASSANT[ep_col]
+                        break
+        return key
+
+    def compute_hash(self) -> int:
+        key = 0
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                piece = self.board[row][col]
+                if piece:
+                    key ^= ZOBRIST_PIECES[piece.color_id][piece.type_id][row * BOARD_SIZE + col]
+        if self.turn == COLOR_BLACK:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key ^ self._hash_extras()
+
+    def clone(self) -> 'ChessBoard':
+        """Copy of the position (without UI state) that can be searched separately"""
+        other = ChessBoard()
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                piece = self.board[row][col]
+                if piece:
+                    copy = Piece(piece.color_id, piece.type_id, piece.position)
+                    copy.has_moved = piece.has_moved
+                    piece = copy
+                other.board[row][col] = piece
+        other.turn = self.turn
+        other.king_positions = list(self.king_positions)
+        other.en_passant_target = self.en_passant_target
+        other.halfmove_clock = self.halfmove_clock
+        other.fullmove_number = self.fullmove_number
+        other.hash = self.hash
+        other.hash_history = list(self.hash_history)
+        other.is_check = self.is_check
+        other.game_over = self.game_over
+        return other
+
+    def reset_history(self):
+        self.hash = self.compute_hash()
+        self.hash_history = [self.hash]
+
+    def load_fen(self, fen: str):
+        """Set up the board from a FEN string (used for perft and automated games).
+
+        Raises ValueError if the FEN is malformed; the board is left unchanged then.
+        """
+        fields = fen.split()
+        if not 2 <= len(fields) <= 6:
+            raise ValueError(f"FEN needs 2 to 6 fields, got {len(fields)}: {fen}")
+        placement, turn = fields[0], fields[1]
+        castling = fields[2] if len(fields) > 2 else '-'
+        en_passant = fields[3] if len(fields) > 3 else '-'
+        if turn not in ('w', 'b'):
+            raise ValueError(f"Invalid side to move in FEN: {turn}")
+        if castling != '-' and (not castling or set(castling) - set('KQkq')):
+            raise ValueError(f"Invalid castling rights in FEN: {castling}")
+        # The square behind a pawn of the side that just moved
+        if en_passant != '-' and (len(en_passant) != 2 or en_passant[0] not in 'abcdefgh'
+                                  or en_passant[1] != ('6' if turn == 'w' else '3')):
+            raise ValueError(f"Invalid en passant square in FEN: {en_passant}")
+        clocks = fields[4:]
+        if not all(clock.isdigit() for clock in clocks):
+            raise ValueError(f"Invalid move counters in FEN: {' '.join(clocks)}")
+        if len(clocks) > 1 and int(clocks[1]) < 1:
+            raise ValueError(f"Invalid fullmove number in FEN: {clocks[1]}")
+
+        fen_rows = placement.split('/')
+        if len(fen_rows) != BOARD_SIZE:
+            raise ValueError(f"FEN placement needs 8 ranks: {placement}")
+        board = [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+        kings = [[], []]
+        for row, fen_row in enumerate(fen_rows):
+            col = 0
+            for char in fen_row:
+                if char in '12345678':
+                    col += int(char)
+                    continue
+                if char.lower() not in FEN_PIECES or col >= BOARD_SIZE:
+                    raise ValueError(f"Invalid FEN rank: {fen_row}")
+                color = COLOR_WHITE if char.isupper() else COLOR_BLACK
+                if char.lower() == 'p' and row in (0, BOARD_SIZE - 1):
+                    raise ValueError(f"Pawn on the first or last rank in FEN: {placement}")
+                piece = Piece(color, FEN_PIECES[char.lower()], (row, col))
+                # Without castling rights the king and rooks count as moved
+                piece.has_moved = piece.type_id in (KING, ROOK)
+                board[row][col] = piece
+                if piece.type_id == KING:
+                    kings[color].append((row, col))
+                col += 1
+            if col != BOARD_SIZE:
+                raise ValueError(f"Invalid FEN rank: {fen_row}")
+        if len(kings[COLOR_WHITE]) != 1 or len(kings[COLOR_BLACK]) != 1:
+            raise ValueError(f"FEN needs exactly one king per side: {placement}")
+        side = COLOR_WHITE if turn == 'w' else COLOR_BLACK
+        if self.is_position_under_attack(kings[1 - side][0], 1 - side, board):
+            raise ValueError(f"Side not to move is in check in FEN: {fen}")
+        en_passant_target = None
+        if en_passant != '-':
+            en_passant_target = (8 - int(en_passant[1]), ord(en_passant[0]) - ord('a'))
+            ep_row, ep_col = en_passant_target
+            pawn_row = ep_row + (1 if side == COLOR_WHITE else -1)
+            pawn = board[pawn_row][ep_col]
+            if (board[ep_row][ep_col] or not pawn or pawn.type_id != PAWN
+                    or pawn.color_id == side):
+                raise ValueError(f"No pawn can be captured en passant on {en_passant}")
+
+        self.board = board
+        self.king_positions = [kings[COLOR_WHITE][0], kings[COLOR_BLACK][0]]
+        for char, row, rook_col in (('K', 7, 7), ('Q', 7, 0), ('k', 0, 7), ('q', 0, 0)):
+            if char in castling:
+                for c in (4, rook_col):
+                    if self.board[row][c]:
+                        self.board[row][c].has_moved = False
+        self.turn = side
+        self.en_passant_target = en_passant_target
+        self.halfmove_clock = int(clocks[0]) if clocks else 0
+        self.fullmove_number = int(clocks[1]) if len(clocks) > 1 else 1
+        self.selected_piece = None
+        self.valid_moves = []
+        self.reset_history()
+        self.update_game_state()
+
+    def to_fen(self) -> str:
+        """FEN of the current position"""
+        rows = []
         for row in range(BOARD_SIZE):
+            fen_row = ''
+            empty = 0
             for col in range(BOARD_SIZE):
                 piece = self.board[row][col]
-                if piece and piece.color == self.current_turn:
-                    # If any piece has valid moves, it's not checkmate
-                    if self.get_all_valid_moves(piece):
-                        return False
-        return True
-
-    def check_pawn_promotion(self, piece: Piece, end_row: int):
-        """Check if a pawn should be promoted and promote it to a queen if necessary"""
-        if piece.piece_type == 'pawn':
-            # Check if white pawn reached top row (0) or black pawn reached bottom row (7)
-            if (piece.color == 'white' and end_row == 0) or (piece.color == 'black' and end_row == 7):
-                # Promote to queen
-                print(f"Превращение пешки в ферзя на позиции {(end_row, piece.position[1])}")
-                return Piece(piece.color, 'queen', (end_row, piece.position[1]))
-        return piece
-
-    def move_piece(self, start: Tuple[int, int], end: Tuple[int, int]) -> bool:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    fen_row += str(empty)
+                    empty = 0
+                char = FEN_CHARS[piece.type_id]
+                fen_row += char.upper() if piece.color_id == COLOR_WHITE else char
+            if empty:
+                fen_row += str(empty)
+            rows.append(fen_row)
+        castling = ''.join(char for char, right in zip('KQkq', self.castling_rights()) if right) or '-'
+        en_passant = '-'
+        if self.en_passant_target:
+            ep_row, ep_col = self.en_passant_target
+            en_passant = f"{chr(ord('a') + ep_col)}{8 - ep_row}"
+        return (f"{'/'.join(rows)} {'w' if self.turn == COLOR_WHITE else 'b'} {castling} "
+                f"{en_passant} {self.halfmove_clock} {self.fullmove_number}")
+
+    def get_legal_moves(self, color: Optional[int] = None) -> List[int]:
+        """All legal moves of a side as packed integers, every promotion piece listed"""
+        color = self.turn if color is None else color
+        moves = []
+        board = self.board
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                piece = board[row][col]
+                if piece is None or piece.color_id != color:
+                    continue
+                start = (row, col)
+                for end in self.get_all_valid_moves(piece):
+                    if piece.type_id == PAWN:
+                        if end[0] == 0 or end[0] == 7:
+                            for promotion in PROMOTION_TYPES:
+                                moves.append(encode_move(start, end, MOVE_PROMOTION, promotion))
+                        elif end[1] != col and board[end[0]][end[1]] is None:
+                            moves.append(encode_move(start, end, MOVE_EN_PASSANT))
+                        else:
+                            moves.append(encode_move(start, end))
+                    elif piece.type_id == KING and abs(end[1] - col) == 2:
+                        moves.append(encode_move(start, end, MOVE_CASTLING))
+                    else:
+                        moves.append(encode_move(start, end))
+        return moves
+
+    def pack_move(self, start: Tuple[int, int], end: Tuple[int, int], promotion: Optional[str] = None) -> int:
+        """Encode a UI move (squares and promotion piece name) for the current position"""
+        piece = self.board[start[0]][start[1]]
+        if self.is_promotion_move(piece, end[0]):
+            return encode_move(start, end, MOVE_PROMOTION, PIECE_CODES[promotion or 'queen'])
+        if piece.type_id == PAWN and end[1] != start[1] and self.board[end[0]][end[1]] is None:
+            return encode_move(start, end, MOVE_EN_PASSANT)
+        if piece.type_id == KING and abs(end[1] - start[1]) == 2:
+            return encode_move(start, end, MOVE_CASTLING)
+        return encode_move(start, end)
+
+    def apply_move(self, start: Tuple[int, int], end: Tuple[int, int], promotion: Optional[str] = None) -> tuple:
+        return self.make_move(self.pack_move(start, end, promotion))
+
+    def make_move(self, move: int) -> tuple:
+        """Make a packed move right away (no animation) and return what undo_move needs"""
+        start_row, start_col = divmod((move >> 6) & 63, BOARD_SIZE)
+        end_row, end_col = divmod(move & 63, BOARD_SIZE)
+        flag = move & MOVE_FLAG_MASK
+        board = self.board
+        piece = board[start_row][start_col]
+        color = piece.color_id
+        piece_keys = ZOBRIST_PIECES[color]
+        captured = board[end_row][end_col]
+        captured_pos = (end_row, end_col)
+        key = self.hash ^ self._hash_extras()
+        undo = [piece, (start_row, start_col), (end_row, end_col), None, None, piece.has_moved, None,
+                self.en_passant_target, self.halfmove_clock, self.hash, self.king_positions[color]]
+
+        if flag == MOVE_EN_PASSANT:
+            captured_pos = (start_row, end_col)
+            captured = board[start_row][end_col]
+            board[start_row][end_col] = None
+        if captured:
+            key ^= ZOBRIST_PIECES[captured.color_id][captured.type_id][captured_pos[0] * BOARD_SIZE + captured_pos[1]]
+        undo[3] = captured
+        undo[4] = captured_pos
+
+        moved = piece
+        if flag == MOVE_PROMOTION:
+            moved = Piece(color, ((move >> 12) & 3) + KNIGHT, (end_row, end_col))
+        board[start_row][start_col] = None
+        board[end_row][end_col] = moved
+        moved.position = (end_row, end_col)
+        moved.has_moved = True
+        key ^= piece_keys[piece.type_id][start_row * BOARD_SIZE + start_col]
+        key ^= piece_keys[moved.type_id][end_row * BOARD_SIZE + end_col]
+
+        if piece.type_id == KING:
+            self.king_positions[color] = (end_row, end_col)
+            # Castling also moves the rook
+            if flag == MOVE_CASTLING:
+                rook_from = (start_row, 7 if end_col > start_col else 0)
+                rook_to = (start_row, 5 if end_col > start_col else 3)
+                rook = board[rook_from[0]][rook_from[1]]
+                board[rook_from[0]][rook_from[1]] = None
+                board[rook_to[0]][rook_to[1]] = rook
+                rook.position = rook_to
+                undo[6] = (rook, rook_from, rook_to, rook.has_moved)
+                rook.has_moved = True
+                key ^= piece_keys[ROOK][rook_from[0] * BOARD_SIZE + rook_from[1]]
+                key ^= piece_keys[ROOK][rook_to[0] * BOARD_SIZE + rook_to[1]]
+
+        if piece.type_id == PAWN and abs(end_row - start_row) == 2:
+            self.en_passant_target = ((start_row + end_row) // 2, start_col)
+        else:
+            self.en_passant_target = None
+        if piece.type_id == PAWN or captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if color == COLOR_BLACK:
+            self.fullmove_number += 1
+
+        self.turn ^= 1
+        self.hash = key ^ ZOBRIST_BLACK_TO_MOVE ^ self._hash_extras()
+        self.hash_history.append(self.hash)
+        return tuple(undo)
+
+    def undo_move(self, undo: tuple):
+        (piece, start, end, captured, captured_pos, had_moved, rook_move, en_passant_target,
+         halfmove_clock, key, king_pos) = undo
+        board = self.board
+        board[end[0]][end[1]] = None
+        board[start[0]][start[1]] = piece
+        piece.position = start
+        piece.has_moved = had_moved
+        if captured:
+            board[captured_pos[0]][captured_pos[1]] = captured
+        if rook_move:
+            rook, rook_from, rook_to, rook_had_moved = rook_move
+            board[rook_to[0]][rook_to[1]] = None
+            board[rook_from[0]][rook_from[1]] = rook
+            rook.position = rook_from
+            rook.has_moved = rook_had_moved
+        self.en_passant_target = en_passant_target
+        self.halfmove_clock = halfmove_clock
+        self.hash = key
+        self.turn ^= 1
+        self.king_positions[self.turn] = king_pos
+        if self.turn == COLOR_BLACK:
+            self.fullmove_number -= 1
+        self.hash_history.pop()
+
+    def is_threefold_repetition(self) -> bool:
+        # Only positions since the last capture or pawn move, with the same side to move, can repeat
+        history = self.hash_history
+        current = history[-1]
+        count = 1
+        stop = max(len(history) - 2 - self.halfmove_clock, -1)
+        for index in range(len(history) - 3, stop, -2):
+            if history[index] == current:
+                count += 1
+                if count >= 3:
+                    return True
+        return False
+
+    def update_game_state(self):
+        """Refresh check, mate and draw flags for the side to move"""
+        king_pos = self.king_positions[self.turn]
+        self.is_check = self.is_position_under_attack(king_pos, self.turn)
+        has_moves = self.has_legal_moves()
+        self.is_checkmate = self.is_check and not has_moves
+        self.is_stalemate = not self.is_check and not has_moves
+        self.draw_reason = None
+        if self.is_stalemate:
+            self.draw_reason = 'stalemate'
+        elif not self.is_checkmate:
+            if self.halfmove_clock >= 100:
+                self.draw_reason = 'fifty-move rule'
+            elif self.is_threefold_repetition():
+                self.draw_reason = 'threefold repetition'
+        self.game_over = self.is_checkmate or self.draw_reason is not None
+
+    def perft(self, depth: int) -> int:
+        """Count the leaf nodes of the legal move tree, used to verify the move generator"""
+        if depth == 0:
+            return 1
+        moves = self.get_legal_moves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            undo = self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.undo_move(undo)
+        return nodes
+
+    def move_piece(self, start: Tuple[int, int], end: Tuple[int, int], promotion: str = 'queen',
+                   on_finish=None) -> bool:
         start_row, start_col = start
         end_row, end_col = end
         piece = self.board[start_row][start_col]
         if piece and (end_row, end_col) in self.valid_moves:
             def finish_move():
-                nonlocal piece, start_row, start_col, end_row, end_col
-                piece2 = self.check_pawn_promotion(piece, end_row)
-                captured_piece = self.board[end_row][end_col]
-                self.board[end_row][end_col] = piece2
-                self.board[start_row][start_col] = None
-                piece2.position = (end_row, end_col)
-                piece2.has_moved = True
-                if piece2.piece_type == 'king':
-                    if piece2.color == 'white':
-                        self.white_king_pos = (end_row, end_col)
-                    else:
-                        self.black_king_pos = (end_row, end_col)
-                self.current_turn = 'black' if self.current_turn == 'white' else 'white'
-                king_pos = self.black_king_pos if self.current_turn == 'black' else self.white_king_pos
-                self.is_check = self.is_position_under_attack(king_pos, self.current_turn)
-                if self.is_check:
-                    self.is_checkmate = self.is_in_checkmate()
-                    if self.is_checkmate:
-                        winner = 'white' if self.current_turn == 'black' else 'black'
-                        self.game_over = True
+                if self.is_promotion_move(piece, end_row):
+                    print(f"Превращение пешки в {promotion} на позиции {(end_row, end_col)}")
+                self.apply_move(start, end, promotion)
+                self.update_game_state()
+                if on_finish:
+                    on_finish()
             self.start_animation(piece, (start_row, start_col), (end_row, end_col), finish_move)
             return True
         return False
 
+def score_to_tt(score: float, ply: int) -> float:
+    # Mate scores count plies from the root; the table keeps them relative to the node
+    if score > MATE_THRESHOLD:
+        return score + ply
+    if score < -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+def score_from_tt(score: float, ply: int) -> float:
+    if score > MATE_THRESHOLD:
+        return score - ply
+    if score < -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+class SearchAborted(Exception):
+    """Raised inside the search when its time is up or it was asked to stop"""
+
 class ChessAI:
     def __init__(self, board: 'ChessBoard', color: str):
         self.board = board
         self.color = color
+        self.color_id = COLOR_CODES[color]
         self.move_count = 0
+        self.params = load_eval_params()
+        # Capture values indexed by piece code
+        self.capture_values = [0] + [self.params['piece_values'][name] * self.params['capture_weight']
+                                     for name in PIECE_NAMES[1:]]
+        self.eval_weights = params_to_weights(self.params)
+        # Search settings and state
+        self.think_time = AI_THINK_TIME
+        self.max_depth = AI_MAX_DEPTH
+        self.tt = {}  # Zobrist hash -> (depth, score, flag, best move)
+        self.pv = []
+        self.depth = 0
+        self.completed_depth = 0
+        self.nodes = 0
+        self.deadline = None
+        self.stop_event = None
+        # Background search: the timed search for a move or pondering on the opponent's time
+        self.search_thread = None
+        self.search_stop = None
+        self.search_timer = None
+        self.search_result = None
+        self.search_start = 0
+        self.ponder_move = None  # expected reply while pondering
         # Common chess openings (from black's perspective)
         self.openings = [
             # Sicilian Defense
@@ -452,44 +1008,228 @@ class ChessAI:
         ]
         print(f"AI initialized. Playing as {COLORS[color]}")
 
-    def evaluate_move(self, piece, move):
+    def evaluate_move(self, piece, move, board: Optional['ChessBoard'] = None):
         score = 0
-        target_piece = self.board.get_piece_at(move)
+        params = self.params
+        target_piece = (board or self.board).get_piece_at(move)
         
         # Prioritize capturing pieces
         if target_piece:
-            piece_values = {
-                'pawn': 1,
-                'knight': 3,
-                'bishop': 3,
-                'rook': 5,
-                'queen': 9,
-                'king': 100
-            }
-            score += piece_values[target_piece.piece_type] * 10
-        
-        # Bonus for center control
-        center_squares = [(3, 3), (3, 4), (4, 3), (4, 4)]
-        if move in center_squares:
-            score += 2
-            
-        # Bonus for developing pieces
-        if not piece.has_moved:
-            score += 1
+            score += self.capture_values[target_piece.type_id]
+
+        # Change of the center and development features used by evaluate_position
+        if piece.type_id != KING:
+            score += params['center_bonus'] * ((move in CENTER_SQUARES) - (piece.position in CENTER_SQUARES))
+            home = MINOR_HOME_SQUARES.get((piece.color_id, piece.type_id))
+            if home is not None:
+                score += params['development_bonus'] * ((piece.position in home) - (move in home))
             
         # Penalty for moving pieces multiple times in opening
         if self.move_count < 10 and piece.has_moved:
-            score -= 1
+            score -= params['repeat_move_penalty']
             
         return score
 
+    def evaluate_position(self, board: 'ChessBoard') -> float:
+        """Static evaluation from the point of view of the side to move"""
+        features = position_features(
+            (piece.color_id, piece.type_id, row, col)
+            for row, pieces in enumerate(board.board)
+            for col, piece in enumerate(pieces) if piece
+        )
+        score = sum(weight * value for weight, value in zip(self.eval_weights, features))
+        return score if board.turn == COLOR_WHITE else -score
+
+    def order_moves(self, board: 'ChessBoard', moves: List[int], tt_move: Optional[int]) -> List[int]:
+        # Hash move first, the rest by the same heuristic the greedy AI used
+        def key(move):
+            if move == tt_move:
+                return float('inf')
+            start = divmod((move >> 6) & 63, BOARD_SIZE)
+            end = divmod(move & 63, BOARD_SIZE)
+            return self.evaluate_move(board.board[start[0]][start[1]], end, board)
+        return sorted(moves, key=key, reverse=True)
+
+    def _check_stop(self):
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchAborted()
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise SearchAborted()
+
+    def negamax(self, board: 'ChessBoard', depth: int, alpha: float, beta: float, ply: int) -> float:
+        self.nodes += 1
+        # Depth 1 always finishes so that there is a move to play
+        if self.depth > 1 and self.nodes & 255 == 0:
+            self._check_stop()
+        if ply and (board.halfmove_clock >= 100 or board.is_threefold_repetition()):
+            return 0
+
+        key = board.hash
+        entry = self.tt.get(key)
+        tt_move = None
+        if entry:
+            entry_depth, entry_score, entry_flag, tt_move = entry
+            entry_score = score_from_tt(entry_score, ply)
+            if ply and entry_depth >= depth:
+                if entry_flag == TT_EXACT:
+                    return entry_score
+                if entry_flag == TT_LOWER:
+                    alpha = max(alpha, entry_score)
+                elif entry_flag == TT_UPPER:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score
+
+        if depth == 0:
+            return self.evaluate_position(board)
+
+        moves = board.get_legal_moves()
+        if not moves:
+            if board.is_position_under_attack(board.king_positions[board.turn], board.turn):
+                return -MATE_SCORE + ply
+            return 0
+
+        original_alpha = alpha
+        best_score = -float('inf')
+        best_move = None
+        for move in self.order_moves(board, moves, tt_move):
+            undo = board.make_move(move)
+            score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.undo_move(undo)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = TT_UPPER
+        elif best_score >= beta:
+            flag = TT_LOWER
+        else:
+            flag = TT_EXACT
+        if len(self.tt) >= TT_MAX_ENTRIES:
+            self.tt.clear()
+        self.tt[key] = (depth, score_to_tt(best_score, ply), flag, best_move)
+        return best_score
+
+    def extract_pv(self, board: 'ChessBoard', depth: int) -> List[int]:
+        """Follow the best moves stored in the transposition table"""
+        pv = []
+        undos = []
+        for _ in range(depth):
+            entry = self.tt.get(board.hash)
+            if not entry or entry[3] is None or entry[3] not in board.get_legal_moves():
+                break
+            pv.append(entry[3])
+            undos.append(board.make_move(entry[3]))
+        for undo in reversed(undos):
+            board.undo_move(undo)
+        return pv
+
+    def search(self, board: 'ChessBoard', time_limit: Optional[float] = None,
+               stop_event: Optional[threading.Event] = None) -> Optional[int]:
+        """Iterative deepening search; the board is left in an undefined state if aborted"""
+        self.nodes = 0
+        self.deadline = time.time() + time_limit if time_limit else None
+        self.stop_event = stop_event
+        self.completed_depth = 0
+        best_move = None
+        for depth in range(1, self.max_depth + 1):
+            self.depth = depth
+            try:
+                self.negamax(board, depth, -float('inf'), float('inf'), 0)
+            except SearchAborted:
+                break
+            self.completed_depth = depth
+            self.pv = self.extract_pv(board, depth)
+            if self.pv:
+                best_move = self.pv[0]
+        return best_move
+
+    def _run_search(self, board: 'ChessBoard', time_limit: Optional[float], stop_event: threading.Event):
+        self.search_result = self.search(board, time_limit, stop_event)
+
+    def start_search(self, board: 'ChessBoard', time_limit: Optional[float] = None):
+        """Search a copy of a position in a background thread, keeping the UI responsive"""
+        self.search_stop = threading.Event()
+        self.search_result = None
+        self.search_start = time.time()
+        self.search_thread = threading.Thread(target=self._run_search,
+                                              args=(board, time_limit, self.search_stop), daemon=True)
+        self.search_thread.start()
+
+    def stop_search(self) -> Optional[int]:
+        """Stop the background search and return its best move"""
+        if self.search_thread is None:
+            return None
+        self.search_stop.set()
+        self.search_thread.join()
+        if self.search_timer:
+            self.search_timer.cancel()
+        self.search_thread = None
+        self.search_stop = None
+        self.search_timer = None
+        self.ponder_move = None
+        return self.search_result
+
+    def start_pondering(self):
+        """Search the position after the expected reply while the opponent thinks"""
+        self.stop_search()
+        if self.board.game_over:
+            return
+        board = self.board.clone()
+        moves = board.get_legal_moves()
+        predicted = self.pv[1] if len(self.pv) >= 2 else None
+        if predicted not in moves:
+            # No PV after a book move: take the table's move or the best ordered one
+            entry = self.tt.get(board.hash)
+            predicted = self.order_moves(board, moves, entry[3] if entry else None)[0]
+        board.make_move(predicted)
+        self.start_search(board)
+        self.ponder_move = predicted
+        start, end, _ = decode_move(predicted)
+        print(f"AI is pondering on the expected reply from {start} to {end}")
+
+    def stop_pondering(self, played_move: Optional[int] = None) -> bool:
+        """End pondering, returns True if the predicted move was played.
+
+        On a hit the pondering search already works on the new position, so it
+        keeps running and is only given the usual think time from now on.
+        """
+        if self.ponder_move is None:
+            return False
+        if played_move is not None and played_move == self.ponder_move:
+            self.ponder_move = None
+            self.search_start = time.time()
+            self.search_timer = threading.Timer(self.think_time, self.search_stop.set)
+            self.search_timer.daemon = True
+            self.search_timer.start()
+            print(f"Ponder hit, continuing the search from depth {self.completed_depth + 1}")
+            return True
+        if played_move is not None:
+            print("Ponder miss, background search aborted")
+        self.stop_search()
+        return False
+
     def make_move(self) -> bool:
+        """Called every frame on the AI's turn; returns True once the AI's move is started.
+
+        The search runs in a background thread, so this only starts it and later
+        plays its result.
+        """
         if self.board.current_turn != self.color:
             print(f"Not AI's turn. Current turn: {COLORS[self.board.current_turn]}")
             return False
-            
+        if self.search_thread is not None and self.ponder_move is None:
+            if self.search_thread.is_alive():
+                return False
+            return self.play_search_result()
+
+        self.stop_pondering()
         print("\nAI starts searching for possible moves...")
-        all_moves = []
         
         # Try to use opening book moves in the beginning
         if self.move_count < len(self.openings):
@@ -497,14 +1237,17 @@ class ChessAI:
             for row in range(BOARD_SIZE):
                 for col in range(BOARD_SIZE):
                     piece = self.board.board[row][col]
-                    if piece and piece.color == self.color and piece.piece_type == 'pawn':
+                    if piece and piece.color_id == self.color_id and piece.type_id == PAWN:
                         valid_moves = self.board.get_all_valid_moves(piece)
                         if opening_move in valid_moves:
                             print(f"Using opening book move: {piece.piece_type} from {piece.position} to {opening_move}")
                             self.board.selected_piece = piece
                             self.board.valid_moves = valid_moves
-                            success = self.board.move_piece(piece.position, opening_move)
+                            success = self.board.move_piece(piece.position, opening_move,
+                                                            on_finish=self.start_pondering)
                             if success:
+                                # The last search's PV does not follow from this move
+                                self.pv = []
                                 self.board.ai_move_from = piece.position
                                 self.board.ai_move_to = opening_move
                                 self.board.ai_move_display_time = pygame.time.get_ticks()
@@ -514,43 +1257,36 @@ class ChessAI:
                                 return True
         
         # If no opening move is available or we're past the opening phase
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                piece = self.board.board[row][col]
-                if piece and piece.color == self.color:
-                    valid_moves = self.board.get_all_valid_moves(piece)
-                    if valid_moves:
-                        for move in valid_moves:
-                            score = self.evaluate_move(piece, move)
-                            all_moves.append((piece, move, score))
-        
-        if all_moves:
-            # Sort moves by score in descending order
-            all_moves.sort(key=lambda x: x[2], reverse=True)
-            # Choose the best move
-            piece, end, _ = all_moves[0]
-            start = piece.position
-            print(f"AI chose move: {piece.piece_type} from {start} to {end}")
-            
-            self.board.selected_piece = piece
-            self.board.valid_moves = [end]
-            
-            success = self.board.move_piece(start, end)
-            if success:
-                self.board.ai_move_from = start
-                self.board.ai_move_to = end
-                self.board.ai_move_display_time = pygame.time.get_ticks()
-                self.board.selected_piece = None
-                self.board.valid_moves = []
-                self.move_count += 1
-                print("Move successfully executed")
-            else:
-                print("Error executing move")
-            return success
-        else:
+        self.start_search(self.board.clone(), time_limit=self.think_time)
+        return False
+
+    def play_search_result(self) -> bool:
+        best_move = self.stop_search()
+        if best_move is None:
             print("AI found no possible moves")
             return False
 
+        start, end, promotion = decode_move(best_move)
+        piece = self.board.get_piece_at(start)
+        print(f"AI chose move: {piece.piece_type} from {start} to {end} "
+              f"(depth {self.completed_depth}, {self.nodes} nodes, {time.time() - self.search_start:.2f}s)")
+        
+        self.board.selected_piece = piece
+        self.board.valid_moves = [end]
+        
+        success = self.board.move_piece(start, end, promotion or 'queen', on_finish=self.start_pondering)
+        if success:
+            self.board.ai_move_from = start
+            self.board.ai_move_to = end
+            self.board.ai_move_display_time = pygame.time.get_ticks()
+            self.board.selected_piece = None
+            self.board.valid_moves = []
+            self.move_count += 1
+            print("Move successfully executed")
+        else:
+            print("Error executing move")
+        return success
+
 class ChessGame:
     def __init__(self, screen):
         self.screen = screen
@@ -562,6 +1298,7 @@ class ChessGame:
         self.font = GAME_FONT
         self.paused = False
         self.running = True
+        self.pending_promotion = None
         self.create_menus()
 
     def create_menus(self):
@@ -619,6 +1356,7 @@ class ChessGame:
         self.board = ChessBoard()
         self.ai = None
         self.paused = False
+        self.pending_promotion = None
         self.running = True
         self.run_game()
 
@@ -629,6 +1367,7 @@ class ChessGame:
         # Initialize AI with the opposite color of the player
         self.ai = ChessAI(self.board, 'black' if color == 'white' else 'white')
         self.paused = False
+        self.pending_promotion = None
         self.running = True
         self.run_game()
 
@@ -638,12 +1377,20 @@ class ChessGame:
         return
 
     def to_main_menu(self):
+        if self.ai:
+            self.ai.stop_search()
         self.board = None
         self.ai = None
         self.paused = False
         self.running = False
         self.main_menu.mainloop(self.screen)
 
+    def play_move(self, start: Tuple[int, int], end: Tuple[int, int], promotion: str = 'queen') -> bool:
+        # Any move entered by the player ends the AI's pondering
+        if self.ai and end in self.board.valid_moves:
+            self.ai.stop_pondering(self.board.pack_move(start, end, promotion))
+        return self.board.move_piece(start, end, promotion)
+
     def handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -654,6 +1401,14 @@ class ChessGame:
                 if event.key == pygame.K_ESCAPE:
                     self.paused = True
                     return
+                # Finish a pawn promotion with the chosen piece
+                if self.pending_promotion and event.key in PROMOTION_KEYS:
+                    start, end = self.pending_promotion
+                    self.pending_promotion = None
+                    if self.play_move(start, end, PROMOTION_KEYS[event.key]):
+                        self.board.selected_piece = None
+                        self.board.valid_moves = []
+                    return
 
             if not self.board.game_over and event.type == pygame.MOUSEBUTTONDOWN and not self.paused:
                 mouse_pos = pygame.mouse.get_pos()
@@ -667,9 +1422,14 @@ class ChessGame:
                         col = 7 - col
                     
                     clicked_piece = self.board.get_piece_at((row, col))
+                    self.pending_promotion = None
                     
                     if self.board.selected_piece:
-                        if self.board.move_piece(self.board.selected_piece.position, (row, col)):
+                        selected = self.board.selected_piece
+                        if (row, col) in self.board.valid_moves and self.board.is_promotion_move(selected, row):
+                            # Wait for the player to pick the promotion piece
+                            self.pending_promotion = (selected.position, (row, col))
+                        elif self.play_move(selected.position, (row, col)):
                             self.board.selected_piece = None
                             self.board.valid_moves = []
                         elif clicked_piece and clicked_piece.color == self.board.current_turn:
@@ -688,7 +1448,13 @@ class ChessGame:
         self.screen.fill(BLACK)
         
         current_color = COLORS[self.board.current_turn]
-        if self.board.is_check and not self.board.is_checkmate:
+        if self.pending_promotion:
+            message = MESSAGES['promotion']
+        elif self.board.is_stalemate:
+            message = MESSAGES['stalemate']
+        elif self.board.draw_reason:
+            message = MESSAGES['draw'].format(self.board.draw_reason)
+        elif self.board.is_check and not self.board.is_checkmate:
             message = MESSAGES['check'].format(current_color)
         elif self.board.is_checkmate:
             winner_color = COLORS['white'] if self.board.current_turn == "black" else COLORS['black']
@@ -742,6 +1508,9 @@ def draw_message_box(surface: pygame.Surface, message: str, font: pygame.font.Fo
     surface.blit(text, text_rect)
 
 def main():
+    # Initialize the screen here so the engine can be imported without a window (server.py)
+    screen = pygame.display.set_mode((WINDOW_SIZE, TOTAL_HEIGHT))
+    pygame.display.set_caption('Chess')
     load_images()  # Load images before starting the game
     game = ChessGame(screen)
     game.main_menu.mainloop(screen)
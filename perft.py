@@ -0,0 +1,76 @@
+"""Regression check for the move generator and the incremental position hash.
+
+Compares perft node counts of well-known positions with their reference values
+and plays random games checking that the hash kept by make_move/undo_move
+always equals a full recomputation. Exits with status 1 on any mismatch.
+
+Usage:
+    python perft.py
+    python perft.py --games 200 --seed 1
+"""
+import argparse
+import random
+import sys
+
+from main import ChessBoard
+
+# (name, FEN, {depth: nodes}) from the Chess Programming Wiki perft results
+PERFT_POSITIONS = [
+    ('start', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1', {1: 20, 2: 400, 3: 8902}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', {1: 48, 2: 2039}),
+    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', {1: 14, 2: 191, 3: 2812}),
+    ('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', {1: 6, 2: 264, 3: 9467}),
+    ('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', {1: 44, 2: 1486}),
+]
+
+
+def check_perft() -> int:
+    failures = 0
+    board = ChessBoard()
+    for name, fen, expected in PERFT_POSITIONS:
+        board.load_fen(fen)
+        for depth, nodes in expected.items():
+            result = board.perft(depth)
+            status = 'ok' if result == nodes else f'FAILED (expected {nodes})'
+            print(f"perft {name} depth {depth}: {result} {status}")
+            failures += result != nodes
+    return failures
+
+
+def check_hash(games: int, max_plies: int, seed: int) -> int:
+    """Play random games, checking the incremental hash on every move and after undoing them"""
+    rng = random.Random(seed)
+    failures = 0
+    for game in range(games):
+        board = ChessBoard()
+        undos = []
+        for _ in range(max_plies):
+            moves = board.get_legal_moves()
+            if not moves:
+                break
+            undos.append(board.make_move(rng.choice(moves)))
+            if board.hash != board.compute_hash():
+                print(f"hash mismatch in game {game} after {len(undos)} plies: {board.to_fen()}")
+                failures += 1
+                break
+        while undos:
+            board.undo_move(undos.pop())
+        if board.hash != board.compute_hash() or board.hash_history != [board.hash]:
+            print(f"hash mismatch in game {game} after undoing all moves")
+            failures += 1
+    print(f"hash check over {games} random games: {'ok' if not failures else f'{failures} FAILED'}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check move generation and position hashing')
+    parser.add_argument('--games', type=int, default=50, help='random games for the hash check')
+    parser.add_argument('--max-plies', type=int, default=120)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    failures = check_perft() + check_hash(args.games, args.max_plies, args.seed)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+"""Asyncio server hosting many simultaneous chess games in one process.
+
+Clients talk newline-delimited JSON over a local TCP socket. Every request is
+one object with a ``cmd`` field, every reply has ``ok`` and either the result
+or an ``error`` message:
+
+    {"cmd": "new", "mode": "human_vs_ai", "color": "white", "move_time": 0.5}
+    {"cmd": "move", "session": 1, "move": "e2e4"}     (the AI answers right away)
+    {"cmd": "ai_move", "session": 1}                  (AI plays the side to move)
+    {"cmd": "state", "session": 1}
+    {"cmd": "close", "session": 1}
+
+Searches are CPU-bound, so they run in a shared process pool. Each session has
+its own time per move, and the scheduler serves sessions in arrival order with
+at most one search per session in flight.
+
+Usage:
+    python server.py --port 8765 --workers 4
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+from main import ChessAI, ChessBoard, COLOR_NAMES, PIECE_CODES, FEN_CHARS, decode_move
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MOVE_TIME = 0.5  # seconds
+MAX_MOVE_TIME = 5.0
+MODES = ('human_vs_ai', 'ai_vs_ai')
+# Errors answered with {"ok": false}; search failures arrive as RuntimeError
+REQUEST_ERRORS = (ValueError, KeyError, TypeError, RuntimeError)
+
+# One ChessAI per worker process and color, so the transposition table is reused
+_worker_ais: Dict[str, ChessAI] = {}
+
+
+def search_move(board: ChessBoard, color: str, time_limit: float) -> Tuple[Optional[int], int, int]:
+    """Runs in a pool process: best move for `color`, completed depth and node count"""
+    ai = _worker_ais.get(color)
+    if ai is None:
+        ai = _worker_ais[color] = ChessAI(board, color)
+    ai.board = board
+    move = ai.search(board, time_limit=time_limit)
+    return move, ai.completed_depth, ai.nodes
+
+
+def square_name(square: Tuple[int, int]) -> str:
+    return f"{chr(ord('a') + square[1])}{8 - square[0]}"
+
+
+def parse_square(name: str) -> Tuple[int, int]:
+    if len(name) != 2 or name[0] not in 'abcdefgh' or name[1] not in '12345678':
+        raise ValueError(f"Invalid square: {name}")
+    return 8 - int(name[1]), ord(name[0]) - ord('a')
+
+
+def move_to_uci(move: int) -> str:
+    start, end, promotion = decode_move(move)
+    suffix = FEN_CHARS[PIECE_CODES[promotion]] if promotion else ''
+    return square_name(start) + square_name(end) + suffix
+
+
+def uci_to_move(board: ChessBoard, uci: str) -> int:
+    """Find the legal packed move matching a UCI string such as e2e4 or e7e8n"""
+    if len(uci) not in (4, 5):
+        raise ValueError(f"Invalid move: {uci}")
+    parse_square(uci[:2])
+    parse_square(uci[2:4])
+    for move in board.get_legal_moves():
+        if move_to_uci(move) == uci or (len(uci) == 4 and move_to_uci(move) == uci + 'q'):
+            return move
+    raise ValueError(f"Illegal move: {uci}")
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Next request line, None once the client is gone.
+
+    An over-long line is skipped up to its newline and reported as ValueError,
+    so the following request is read from its start.
+    """
+    try:
+        return await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as e:
+        return e.partial or None
+    except asyncio.LimitOverrunError:
+        pass
+    while True:
+        try:
+            await reader.readuntil(b'\n')
+            break
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError as e:
+            await reader.readexactly(e.consumed)
+    raise ValueError("Request line is too long")
+
+
+class GameSession:
+    """One game: its board, which sides the AI plays and its time per move"""
+
+    def __init__(self, session_id: int, mode: str, human_color: str, move_time: float,
+                 fen: Optional[str] = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}")
+        if human_color not in COLOR_NAMES:
+            raise ValueError(f"Unknown color: {human_color}")
+        self.session_id = session_id
+        self.mode = mode
+        self.board = ChessBoard()
+        if fen is not None:
+            if not isinstance(fen, str):
+                raise ValueError("fen must be a string")
+            self.board.load_fen(fen)
+        if mode == 'ai_vs_ai':
+            self.ai_colors = set(COLOR_NAMES)
+        else:
+            self.ai_colors = {'black' if human_color == 'white' else 'white'}
+        self.move_time = move_time
+        self.moves = []
+        # Requests of one session are handled one at a time
+        self.lock = asyncio.Lock()
+
+    @property
+    def status(self) -> str:
+        if self.board.is_checkmate:
+            return 'checkmate'
+        return self.board.draw_reason or 'ongoing'
+
+    def play(self, move: int):
+        self.board.make_move(move)
+        self.board.update_game_state()
+        self.moves.append(move_to_uci(move))
+
+    def state(self) -> dict:
+        return {
+            'session': self.session_id,
+            'fen': self.board.to_fen(),
+            'turn': self.board.current_turn,
+            'status': self.status,
+            'moves': len(self.moves),
+        }
+
+
+class SearchScheduler:
+    """Hands searches to the process pool in arrival order"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.queue = asyncio.Queue()
+        # As many dispatchers as workers, so queued searches never pile up inside the pool
+        self.dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(workers)]
+
+    async def search(self, board: ChessBoard, color: str, time_limit: float):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((board, color, time_limit, future))
+        return await future
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            board, color, time_limit, future = await self.queue.get()
+            pool = self.pool
+            try:
+                result = await loop.run_in_executor(pool, search_move, board, color, time_limit)
+            except BrokenProcessPool as e:
+                # A worker died; later searches get a fresh pool
+                if pool is self.pool:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Search worker failed: {e}"))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Search failed: {e}"))
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    async def close(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.pool.shutdown(cancel_futures=True)
+
+
+class GameServer:
+    def __init__(self, workers: int, max_move_time: float = MAX_MOVE_TIME):
+        self.workers = workers
+        self.max_move_time = max_move_time
+        self.sessions: Dict[int, GameSession] = {}
+        self.session_ids = itertools.count(1)
+        self.scheduler = None
+        self.server = None
+        self.clients = {}  # handler task -> writer
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        self.scheduler = SearchScheduler(self.workers)
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            # Closing the connections lets their handlers finish on their own
+            for writer in self.clients.values():
+                writer.close()
+            await asyncio.gather(*self.clients, return_exceptions=True)
+            await self.server.wait_closed()
+        if self.scheduler:
+            await self.scheduler.close()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Sessions belong to the connection that created them
+        owned = set()
+        self.clients[asyncio.current_task()] = writer
+        try:
+            while True:
+                try:
+                    line = await read_request(reader)
+                    if line is None:
+                        break
+                    request = json.loads(line)
+                    response = await self.dispatch(request, owned)
+                    response['ok'] = True
+                except REQUEST_ERRORS as e:
+                    response = {'ok': False, 'error': str(e)}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for session_id in owned:
+                self.sessions.pop(session_id, None)
+            self.clients.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def dispatch(self, request: dict, owned: set) -> dict:
+        if not isinstance(request, dict):
+            raise ValueError("Request must be a JSON object")
+        cmd = request.get('cmd')
+        if cmd == 'new':
+            return self.new_session(request, owned)
+        session = self.get_session(request, owned)
+        async with session.lock:
+            if cmd == 'state':
+                return session.state()
+            if cmd == 'move':
+                return await self.human_move(session, request['move'])
+            if cmd == 'ai_move':
+                return await self.ai_move(session)
+            if cmd == 'close':
+                self.sessions.pop(session.session_id, None)
+                owned.discard(session.session_id)
+                return {'session': session.session_id}
+        raise ValueError(f"Unknown command: {cmd}")
+
+    def new_session(self, request: dict, owned: set) -> dict:
+        move_time = float(request.get('move_time', DEFAULT_MOVE_TIME))
+        if not math.isfinite(move_time) or move_time <= 0:
+            raise ValueError("move_time must be a positive number")
+        move_time = min(move_time, self.max_move_time)
+        session = GameSession(next(self.session_ids), request.get('mode', 'human_vs_ai'),
+                              request.get('color', 'white'), move_time, request.get('fen'))
+        self.sessions[session.session_id] = session
+        owned.add(session.session_id)
+        return session.state()
+
+    def get_session(self, request: dict, owned: set) -> GameSession:
+        """Session named in the request, if it belongs to this connection"""
+        session_id = request.get('session')
+        session = self.sessions.get(session_id) if session_id in owned else None
+        if session is None:
+            raise ValueError(f"Unknown session: {request.get('session')}")
+        return session
+
+    async def human_move(self, session: GameSession, uci: str) -> dict:
+        if session.board.game_over:
+            raise ValueError("Game is over")
+        if session.board.current_turn in session.ai_colors:
+            raise ValueError("It is the AI's turn")
+        session.play(uci_to_move(session.board, uci))
+        response = session.state()
+        if not session.board.game_over and session.board.current_turn in session.ai_colors:
+            response.update(await self.ai_move(session))
+        return response
+
+    async def ai_move(self, session: GameSession) -> dict:
+        if session.board.game_over:
+            raise ValueError("Game is over")
+        color = session.board.current_turn
+        if color not in session.ai_colors:
+            raise ValueError("It is the human player's turn")
+        move, depth, nodes = await self.scheduler.search(session.board, color, session.move_time)
+        if move is None:
+            raise ValueError("AI found no possible moves")
+        session.play(move)
+        response = session.state()
+        response.update({'ai_move': move_to_uci(move), 'depth': depth, 'nodes': nodes})
+        return response
+
+
+async def serve(host: str, port: int, workers: int, max_move_time: float):
+    server = GameServer(workers, max_move_time)
+    await server.start(host, port)
+    print(f"Chess server listening on {host}:{server.port} with {workers} search workers")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Host many chess games over a local JSON socket')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--max-move-time', type=float, default=MAX_MOVE_TIME)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, max(1, args.workers), args.max_move_time))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Texel-style tuner for the evaluation parameters used by ChessAI.
+
+Reads labelled positions (one FEN per line followed by the game result, e.g.
+``<fen> [1-0]`` or the EPD form ``<fen> c9 "1/2-1/2";``), fits the parameters
+by minimizing the squared error between the game result and a sigmoid of the
+evaluation, and writes them to a JSON file that ``load_eval_params`` can load.
+The features come from ``position_features`` in main.py, the same ones
+``ChessAI.evaluate_position`` uses. Malformed lines are skipped and counted.
+
+Usage:
+    python tuner.py positions.epd --iterations 200 --workers 4
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from main import (COLOR_BLACK, COLOR_WHITE, EVAL_FEATURES, EVAL_PARAMS_PATH, FEATURE_CENTER,
+                  FEN_PIECES, load_eval_params, params_to_weights, position_features)
+
+# Pieces whose material balance is tuned (the king is always on the board)
+MATERIAL_PIECES = EVAL_FEATURES[:FEATURE_CENTER]
+
+RESULTS = {'1-0': 1.0, '0-1': 0.0, '1/2-1/2': 0.5}
+# Bracketed results are white's score between 0 and 1
+RESULT_RE = re.compile(r'(1-0|0-1|1/2-1/2)|\[(0(?:\.\d+)?|1(?:\.0+)?)\]')
+
+Sample = Tuple[Tuple[int, ...], float]
+
+
+def parse_labelled_position(line: str) -> Optional[Sample]:
+    """Turn one labelled FEN line into a (features, result) pair, None if it is malformed"""
+    line = line.strip()
+    fields = line.split()
+    if not fields:
+        return None
+    match = RESULT_RE.search(line, len(fields[0]))
+    if not match:
+        return None
+    result = RESULTS[match.group(1)] if match.group(1) else float(match.group(2))
+    pieces = parse_placement(fields[0])
+    if pieces is None:
+        return None
+    return tuple(position_features(pieces)), result
+
+
+def parse_placement(placement: str) -> Optional[List[Tuple[int, int, int, int]]]:
+    """(color, piece type, row, col) codes of a FEN piece placement, None if it is invalid"""
+    rows = placement.split('/')
+    if len(rows) != 8:
+        return None
+    pieces = []
+    for row, fen_row in enumerate(rows):
+        col = 0
+        for char in fen_row:
+            if char in '12345678':
+                col += int(char)
+            elif char.lower() in FEN_PIECES and col < 8:
+                color = COLOR_WHITE if char.isupper() else COLOR_BLACK
+                pieces.append((color, FEN_PIECES[char.lower()], row, col))
+                col += 1
+            else:
+                return None
+        if col != 8:
+            return None
+    return pieces
+
+
+def load_shard(path: str, shard_index: int, shard_count: int) -> Tuple[Counter, int]:
+    """Parse every shard_count-th line of the file, grouping identical samples.
+
+    Returns the samples and the number of non-empty lines that were skipped.
+    """
+    samples = Counter()
+    skipped = 0
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f):
+            if line_number % shard_count != shard_index:
+                continue
+            sample = parse_labelled_position(line)
+            if sample is not None:
+                samples[sample] += 1
+            elif line.strip():
+                skipped += 1
+    return samples, skipped
+
+
+def sigmoid(score: float, k: float) -> float:
+    exponent = max(-500.0, min(500.0, -k * score * math.log(10) / 400))
+    return 1.0 / (1.0 + math.exp(exponent))
+
+
+def shard_error(samples: List[Tuple[Tuple[int, ...], float, int]], weights: List[float],
+                k: float, with_gradient: bool) -> Tuple[float, List[float]]:
+    """Summed squared error (and its gradient) over one shard"""
+    scale = k * math.log(10) / 400
+    error = 0.0
+    gradient = [0.0] * len(weights)
+    for features, result, count in samples:
+        score = 0.0
+        for weight, value in zip(weights, features):
+            score += weight * value
+        predicted = sigmoid(score, k)
+        diff = result - predicted
+        error += count * diff * diff
+        if with_gradient:
+            factor = -2.0 * count * diff * predicted * (1.0 - predicted) * scale
+            for i, value in enumerate(features):
+                if value:
+                    gradient[i] += factor * value
+    return error, gradient
+
+
+def _shard_worker(conn, path: str, shard_index: int, shard_count: int):
+    # Each worker keeps its own shard in memory and scores it on request
+    grouped, skipped = load_shard(path, shard_index, shard_count)
+    samples = [(features, result, count) for (features, result), count in grouped.items()]
+    conn.send((sum(grouped.values()), len(samples), skipped))
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        weights, k, with_gradient = request
+        conn.send(shard_error(samples, weights, k, with_gradient))
+    conn.close()
+
+
+class ShardPool:
+    """Process pool where every worker owns one shard of the positions"""
+
+    def __init__(self, path: str, workers: int):
+        self.connections = []
+        self.processes = []
+        for shard_index in range(workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_shard_worker,
+                args=(child_conn, path, shard_index, workers),
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+        shard_sizes = [conn.recv() for conn in self.connections]
+        self.total = sum(size for size, _, _ in shard_sizes)
+        self.unique = sum(unique for _, unique, _ in shard_sizes)
+        self.skipped = sum(skipped for _, _, skipped in shard_sizes)
+
+    def evaluate(self, weights: List[float], k: float,
+                 with_gradient: bool = False) -> Tuple[float, List[float]]:
+        """Mean squared error and gradient over all shards"""
+        for conn in self.connections:
+            conn.send((weights, k, with_gradient))
+        error = 0.0
+        gradient = [0.0] * len(weights)
+        for conn in self.connections:
+            shard_err, shard_grad = conn.recv()
+            error += shard_err
+            for i, value in enumerate(shard_grad):
+                gradient[i] += value
+        total = max(self.total, 1)
+        return error / total, [value / total for value in gradient]
+
+    def close(self):
+        for conn in self.connections:
+            conn.send(None)
+            conn.close()
+        for process in self.processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def weights_to_params(weights: List[float], base: Dict) -> Dict:
+    params = json.loads(json.dumps(base))
+    capture_weight = params['capture_weight']
+    for piece, weight in zip(MATERIAL_PIECES, weights):
+        params['piece_values'][piece] = round(weight / capture_weight, 3)
+    params['center_bonus'] = round(weights[FEATURE_CENTER], 3)
+    params['development_bonus'] = round(weights[FEATURE_CENTER + 1], 3)
+    return params
+
+
+def fit_k(pool: ShardPool, weights: List[float], low: float = 0.01, high: float = 100.0,
+          steps: int = 30) -> float:
+    """Find the sigmoid scaling constant that best fits the starting weights"""
+    low, high = math.log(low), math.log(high)
+    for _ in range(steps):
+        third = (high - low) / 3
+        if pool.evaluate(weights, math.exp(low + third))[0] < pool.evaluate(weights, math.exp(high - third))[0]:
+            high -= third
+        else:
+            low += third
+    return math.exp((low + high) / 2)
+
+
+def tune(pool: ShardPool, weights: List[float], k: float, iterations: int,
+         learning_rate: float) -> List[float]:
+    """Adam optimization of the weights against the shared error function"""
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    m = [0.0] * len(weights)
+    v = [0.0] * len(weights)
+    weights = list(weights)
+    for iteration in range(1, iterations + 1):
+        start = time.time()
+        error, gradient = pool.evaluate(weights, k, with_gradient=True)
+        for i, grad in enumerate(gradient):
+            m[i] = beta1 * m[i] + (1 - beta1) * grad
+            v[i] = beta2 * v[i] + (1 - beta2) * grad * grad
+            m_hat = m[i] / (1 - beta1 ** iteration)
+            v_hat = v[i] / (1 - beta2 ** iteration)
+            weights[i] -= learning_rate * m_hat / (math.sqrt(v_hat) + epsilon)
+        print(f"Iteration {iteration}: error {error:.6f} ({time.time() - start:.2f}s)")
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune ChessAI evaluation parameters')
+    parser.add_argument('positions', help='file with labelled FEN positions')
+    parser.add_argument('--params', default=EVAL_PARAMS_PATH, help='starting parameter file')
+    parser.add_argument('--output', default=EVAL_PARAMS_PATH, help='where to write tuned parameters')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--learning-rate', type=float, default=0.1)
+    parser.add_argument('--k', type=float, default=None, help='sigmoid scaling (fitted if omitted)')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    # Missing entries fall back to the engine's defaults, as in ChessAI
+    params = load_eval_params(args.params)
+    weights = params_to_weights(params)
+
+    with ShardPool(args.positions, max(1, args.workers)) as pool:
+        print(f"Loaded {pool.total} positions ({pool.unique} unique feature sets)")
+        if pool.skipped:
+            print(f"Skipped {pool.skipped} malformed lines")
+        if pool.total == 0:
+            return
+        k = args.k if args.k is not None else fit_k(pool, weights)
+        print(f"Using K = {k:.4f}, starting error {pool.evaluate(weights, k)[0]:.6f}")
+        weights = tune(pool, weights, k, args.iterations, args.learning_rate)
+
+    tuned = weights_to_params(weights, params)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(tuned, f, indent=4)
+    print(f"Tuned parameters written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()